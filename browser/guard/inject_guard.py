@@ -0,0 +1,479 @@
+"""
+Guard Injector — mitmproxy addon for the Guard summary sidebar.
+
+Every proxied HTML page gets GUARD_SCRIPT spliced in right after its
+<body> tag; the script renders a sidebar that streams a page summary
+from the local summarizer backend (guard/server.py) and keeps a short
+history in localStorage.
+
+NOT yet wired into the browser image: the Dockerfile installs none of
+the dependencies, no s6 service launches mitmdump or the backend, and
+Chrome is not started with --proxy-server (HTTPS interception would
+also need the mitmproxy CA trusted in Chrome's cert store).  Until
+that lands, run the stack by hand next to a proxy-configured Chrome:
+
+    mitmdump -q -s inject_guard.py
+    uvicorn server:app --host 127.0.0.1 --port 8787
+"""
+
+import logging
+import re
+
+from mitmproxy import ctx, http
+
+logger = logging.getLogger("guard")
+
+# Injected verbatim after the page's <body ...> tag.
+# Standalone vanilla JS — same rules as toolbar/toolbar.js: no build tools.
+GUARD_SCRIPT = r"""<script id="guard-script">
+(function () {
+  'use strict';
+
+  if (window.top !== window.self) return; // top-level frames only
+  if (document.getElementById('guard-sidebar')) return; // already injected
+
+  var BACKEND = 'http://127.0.0.1:8787';
+  var MAX_HISTORY = 10;
+
+  var CSS = '' +
+    '#guard-sidebar { position: fixed; top: 0; right: 0; width: 320px; height: 100vh;' +
+    ' background: #1a1d21; color: #e8eaed; font: 13px/1.5 system-ui, sans-serif;' +
+    ' border-left: 1px solid #33373d; z-index: 2147483646; display: flex;' +
+    ' flex-direction: column; box-sizing: border-box; }' +
+    '#guard-header { padding: 10px 12px; font-weight: 600; font-size: 14px;' +
+    ' border-bottom: 1px solid #33373d; flex: 0 0 auto; }' +
+    '#guard-output { padding: 10px 12px; overflow-y: auto; flex: 0 1 auto;' +
+    ' max-height: 45vh; white-space: normal; word-wrap: break-word; }' +
+    '#guard-history { padding: 6px 12px; overflow-y: auto; flex: 1 1 auto;' +
+    ' border-top: 1px solid #33373d; }' +
+    '.guard-entry { margin: 8px 0; padding: 8px; background: #23272d; border-radius: 6px; }' +
+    '.guard-entry-title { font-weight: 600; margin-bottom: 4px; overflow: hidden;' +
+    ' text-overflow: ellipsis; white-space: nowrap; }' +
+    '.guard-entry-text { color: #b7bcc3; max-height: 72px; overflow: hidden; }';
+
+  var EXCLUDE_TAGS = { NAV: 1, HEADER: 1, FOOTER: 1, ASIDE: 1, SCRIPT: 1, STYLE: 1, NOSCRIPT: 1 };
+  var EXTRACT_LIMIT = 4000;
+
+  function renderEntry(item) {
+    var entry = document.createElement('div');
+    entry.className = 'guard-entry';
+    var title = document.createElement('div');
+    title.className = 'guard-entry-title';
+    title.textContent = item.title || item.url || '';
+    var text = document.createElement('div');
+    text.className = 'guard-entry-text';
+    text.textContent = item.text || '';
+    entry.appendChild(title);
+    entry.appendChild(text);
+    return entry;
+  }
+
+  // --- Content extraction ---
+  // Walk text nodes directly instead of cloning the whole DOM and
+  // reading innerText (a full copy plus a forced layout).  Excluded
+  // ancestors are checked per node and the walk stops at the char cap.
+  function extract() {
+    var walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT, {
+      acceptNode: function (n) {
+        var p = n.parentElement;
+        while (p) {
+          if (EXCLUDE_TAGS[p.tagName] || p.id === 'guard-sidebar') return NodeFilter.FILTER_REJECT;
+          p = p.parentElement;
+        }
+        return NodeFilter.FILTER_ACCEPT;
+      }
+    });
+    var out = [];
+    var len = 0;
+    for (var n; (n = walker.nextNode()) && len < EXTRACT_LIMIT;) {
+      var t = n.nodeValue;
+      if (t && t.trim()) {
+        out.push(t);
+        len += t.length;
+      }
+    }
+    return out.join(' ').replace(/\s+/g, ' ').trim().slice(0, EXTRACT_LIMIT);
+  }
+
+  // --- UI ---
+  function createUI() {
+    var style = document.createElement('style');
+    style.id = 'guard-style';
+    style.textContent = CSS;
+    document.head.appendChild(style);
+
+    var sidebar = document.createElement('div');
+    sidebar.id = 'guard-sidebar';
+    sidebar.innerHTML =
+      '<div id="guard-header">Guard</div>' +
+      '<div id="guard-output">Waiting for page…</div>' +
+      '<div id="guard-history"></div>';
+    document.body.appendChild(sidebar);
+
+    var historyContainer = document.getElementById('guard-history');
+    if (historyItems.length) {
+      // One fragment, one append — a single reflow for all entries.
+      var frag = document.createDocumentFragment();
+      for (var i = 0; i < historyItems.length; i++) frag.appendChild(renderEntry(historyItems[i]));
+      historyContainer.appendChild(frag);
+    }
+
+    // Re-append the sidebar if a page script rips it out.  Watch only
+    // direct children of body/head (the sidebar and style live there,
+    // so no subtree pass over every page mutation) and compare nodes
+    // by identity instead of a getElementById per callback.  Disconnect
+    // around our own re-append so it never observes itself.
+    function keepAliveCheck() {
+      if (sidebar.parentElement === document.body && style.parentElement === document.head) return;
+      keepAlive.disconnect();
+      if (style.parentElement !== document.head) document.head.appendChild(style);
+      if (sidebar.parentElement !== document.body) document.body.appendChild(sidebar);
+      keepAliveConnect();
+    }
+    function keepAliveConnect() {
+      keepAlive.observe(document.body, { childList: true });
+      keepAlive.observe(document.head, { childList: true });
+    }
+    var keepAlive = new MutationObserver(keepAliveCheck);
+    keepAliveConnect();
+  }
+
+  // --- History persistence: structured JSON, buffered writes ---
+  // Entries are {title, url, text} in guard-history-v2 — ~3x smaller
+  // than the serialized innerHTML it replaces and no HTML parse on
+  // load.  Writes are staged in memory and flushed when the browser is
+  // idle; visibilitychange force-flushes so nothing is lost when the
+  // tab hides or closes.
+  var historyItems = [];
+  try {
+    historyItems = JSON.parse(localStorage.getItem('guard-history-v2') || '[]');
+  } catch (e) {
+    historyItems = [];
+  }
+
+  var storageCache = { history: null };
+  var flushScheduled = false;
+
+  function flushHistory() {
+    if (storageCache.history === null) return;
+    localStorage.setItem('guard-history-v2', storageCache.history);
+    storageCache.history = null;
+  }
+
+  function persistHistory(serialized) {
+    storageCache.history = serialized;
+    if (flushScheduled) return;
+    flushScheduled = true;
+    (window.requestIdleCallback || function (fn) { setTimeout(fn, 200); })(function () {
+      flushScheduled = false;
+      flushHistory();
+    }, { timeout: 2000 });
+  }
+
+  document.addEventListener('visibilitychange', function () {
+    if (document.visibilityState === 'hidden') flushHistory();
+  });
+
+  // --- Summarize (SSE from guard/server.py) ---
+  var summarizing = false;
+
+  async function summarize() {
+    if (summarizing) return;
+    summarizing = true;
+    var output = document.getElementById('guard-output');
+    var historyContainer = document.getElementById('guard-history');
+    var pageData = { title: document.title, url: location.href, content: extract() };
+    var fullText = '';
+    if (!pageData.content) { summarizing = false; return; }
+    output.textContent = 'Summarizing…';
+    // Incremental Markdown rendering: rebuilding innerHTML from the full
+    // text makes chunk N cost O(N) — quadratic over the stream.  Keep a
+    // two-flag parser state and append text nodes / <b> / <br> instead;
+    // reflow is scoped to the appended node.  Writes stay batched per
+    // animation frame so scrollHeight is read at most once per frame.
+    var rafPending = false;
+    var pendingText = '';
+    var started = false;
+    var inBold = false;
+    var curText = null;
+    var mdCarry = '';
+
+    function appendChunk(s) {
+      s = mdCarry + s;
+      mdCarry = '';
+      if (s.charAt(s.length - 1) === '*' && s.slice(-2) !== '**') {
+        mdCarry = '*';
+        s = s.slice(0, -1);
+      }
+      var parts = s.split('**');
+      for (var i = 0; i < parts.length; i++) {
+        if (i > 0) { inBold = !inBold; curText = null; }
+        if (!parts[i]) continue;
+        var segs = parts[i].split('\n');
+        for (var j = 0; j < segs.length; j++) {
+          if (j > 0) { output.appendChild(document.createElement('br')); curText = null; }
+          if (!segs[j]) continue;
+          if (!curText) {
+            curText = document.createTextNode('');
+            if (inBold) {
+              var bold = document.createElement('b');
+              bold.appendChild(curText);
+              output.appendChild(bold);
+            } else {
+              output.appendChild(curText);
+            }
+          }
+          curText.nodeValue += segs[j];
+        }
+      }
+    }
+
+    function flushOutput() {
+      rafPending = false;
+      if (!started) { started = true; output.textContent = ''; }
+      appendChunk(pendingText);
+      pendingText = '';
+      output.scrollTop = output.scrollHeight; // follow the growing summary
+    }
+    try {
+      var res = await fetch(BACKEND + '/summarize', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(pageData)
+      });
+      var reader = res.body.getReader();
+      var dec = new TextDecoder();
+      var buf = '';
+      for (;;) {
+        var r = await reader.read();
+        if (r.done) break;
+        buf += dec.decode(r.value, { stream: true });
+        var frames = buf.split('\n\n');
+        buf = frames.pop();
+        for (var i = 0; i < frames.length; i++) {
+          if (frames[i].indexOf('data: ') !== 0) continue;
+          var p = JSON.parse(frames[i].slice(6));
+          if (p.chunk) {
+            fullText += p.chunk;
+            pendingText += p.chunk;
+            if (!rafPending) {
+              rafPending = true;
+              requestAnimationFrame(flushOutput);
+            }
+          }
+        }
+      }
+    } catch (e) {
+      output.textContent = 'Guard: summary unavailable';
+    } finally {
+      summarizing = false;
+      if (fullText) {
+        var item = { title: pageData.title, url: pageData.url, text: fullText };
+        historyItems.unshift(item);
+        historyItems = historyItems.slice(0, MAX_HISTORY);
+        historyContainer.insertBefore(renderEntry(item), historyContainer.firstChild);
+        while (historyContainer.children.length > MAX_HISTORY) {
+          historyContainer.removeChild(historyContainer.lastChild);
+        }
+        persistHistory(JSON.stringify(historyItems));
+      }
+    }
+  }
+
+  // --- SPA navigation: re-summarize when the URL changes in place ---
+  // Hook pushState/replaceState + popstate instead of watching DOM
+  // mutations: one callback per navigation instead of one per mutation,
+  // and the URL read is debounced to at most once per frame.
+  var lastUrl = location.href;
+  var pendingNav = 0;
+
+  function onNavigate() {
+    if (pendingNav) return;
+    pendingNav = requestAnimationFrame(function () {
+      pendingNav = 0;
+      if (location.href !== lastUrl) {
+        lastUrl = location.href;
+        setTimeout(summarize, 1000); // let the SPA render first
+      }
+    });
+  }
+
+  function hookHistory(name) {
+    var orig = history[name];
+    history[name] = function () {
+      var ret = orig.apply(this, arguments);
+      onNavigate();
+      return ret;
+    };
+  }
+  hookHistory('pushState');
+  hookHistory('replaceState');
+  window.addEventListener('popstate', onNavigate);
+
+  function start() {
+    createUI();
+    setTimeout(summarize, 500);
+  }
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', start);
+  } else {
+    start();
+  }
+})();
+</script>"""
+
+def _minify_script(src: str) -> str:
+    """Shrink GUARD_SCRIPT once at import; the hot path only splices bytes.
+
+    Deliberately dumb: drop // comments, then collapse the indentation
+    and newlines.  Safe for the script as written — string literals
+    never span lines and none of the comments contain quotes.
+    """
+    src = re.sub(r"(?m)\s*//[^'\"\n]*$", "", src)
+    return re.sub(r"\s*\n\s*", " ", src).strip()
+
+
+# Encoded once at import — the response hook only splices bytes.
+GUARD_SCRIPT_BYTES = _minify_script(GUARD_SCRIPT).encode()
+
+# Hot-path constants: one compiled pattern instead of per-response find()
+# chains, and a cap on how far into the body we look for the tag —
+# real pages open <body> within the first few KB.
+BODY_RE = re.compile(rb"<body\b[^>]*>", re.IGNORECASE)
+CT_HTML = "text/html"
+BODY_SCAN_LIMIT = 65536
+MAX_INJECT_SIZE = 2_000_000  # declared sizes above this skip injection
+SKIP_FETCH_DESTS = ("image", "font", "script", "style")
+
+
+class _StreamInjector:
+    """Per-flow streaming rewriter used by responseheaders().
+
+    Splices GUARD_SCRIPT_BYTES right after the first <body ...> tag and
+    passes every later chunk through untouched, so the body is never
+    buffered in Python.  A tag that straddles a chunk boundary is
+    handled by carrying a trailing partial tag into the next chunk;
+    carried bytes are flushed at end of stream (mitmproxy signals it
+    with an empty chunk) so nothing is ever dropped.
+    """
+
+    def __init__(self) -> None:
+        self.done = False
+        self.carry = b""
+        self.scanned = 0
+
+    def __call__(self, data: bytes) -> "bytes | list[bytes]":
+        # mitmproxy forwards a returned bytes as one chunk and a list as
+        # several; an empty *list* emits nothing (an empty bytes chunk
+        # would terminate chunked framing early).
+        if self.done:
+            return data
+        if not data:  # end of stream: emit anything held back
+            self.done = True
+            out, self.carry = self.carry, b""
+            return out
+        data = self.carry + data
+        self.carry = b""
+        m = BODY_RE.search(data)
+        if m:
+            self.done = True
+            return data[:m.end()] + GUARD_SCRIPT_BYTES + data[m.end():]
+        self.scanned += len(data)
+        if self.scanned >= BODY_SCAN_LIMIT:
+            self.done = True  # same 64 KB give-up as the buffered path
+            return data
+        # Hold back a trailing unterminated tag: real <body ...> tags
+        # carry arbitrarily long attribute lists, so the cut can land
+        # anywhere inside one.  The 64 KB give-up above bounds how much
+        # is ever held, and end-of-stream flushes the carry.
+        lt = data.rfind(b"<")
+        if lt != -1 and data.find(b">", lt) == -1:
+            self.carry = data[lt:]
+            return data[:lt] if lt else []
+        return data
+
+
+class GuardInjector:
+    def load(self, loader):
+        # Bodies above 1 MB are streamed through untouched instead of being
+        # buffered into Python — large assets never become candidates anyway.
+        ctx.options.stream_large_bodies = "1m"
+
+    def responseheaders(self, flow: http.HTTPFlow) -> None:
+        # Identity-encoded candidates are rewritten while streaming —
+        # constant extra cost instead of buffering the whole body.
+        # Compressed bodies fall through to the buffered response()
+        # path, which has to decode them anyway.
+        r = flow.response
+        if not self._candidate(flow):
+            return
+        if r.headers.get("content-encoding", "").lower() not in ("", "identity"):
+            return
+        # The body grows by the script length; drop the stale length and
+        # let mitmproxy reframe the stream towards the client.
+        r.headers.pop("content-length", None)
+        r.stream = _StreamInjector()
+        # Guarded so the URL string isn't even built unless debug is on —
+        # stdout writes per response were blocking the hot path.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("injected (streaming) into %s", flow.request.url)
+
+    @staticmethod
+    def _candidate(flow: http.HTTPFlow) -> bool:
+        # Redirects and errors, non-HTML, bodies declared too large to
+        # be worth the splice, and sub-resource fetches that happen to
+        # carry a text/html content type are all skipped.
+        r = flow.response
+        if r.status_code != 200:
+            return False
+        if not r.headers.get("content-type", "").startswith(CT_HTML):
+            return False
+        cl = r.headers.get("content-length", "")
+        if cl.isdigit() and int(cl) > MAX_INJECT_SIZE:
+            return False
+        if flow.request.headers.get("sec-fetch-dest", "") in SKIP_FETCH_DESTS:
+            return False
+        return True
+
+    def response(self, flow: http.HTTPFlow) -> None:
+        r = flow.response
+        if r.stream:
+            return  # already handled (or passed through) while streaming
+        if not self._candidate(flow):
+            return
+        if flow.response.headers.get("content-encoding", "").lower() not in ("", "identity"):
+            # Compressed upstream: the decode is unavoidable (we have to
+            # see the body to find <body>), but the re-compress is not —
+            # decode() drops the content-encoding header, so the spliced
+            # body below goes out identity-encoded.  We serve Chrome over
+            # loopback, so wire size is irrelevant and re-encoding the
+            # whole body would be pure CPU.  (Appending a pre-gzipped
+            # script as a second gzip member was tried first; Chrome's
+            # and curl's inflaters stop at the first member.)
+            try:
+                flow.response.decode()
+            except ValueError:
+                return  # unknown encoding — leave the response alone
+        # flow.response.content is the content-encoding-decoded body as
+        # bytes; a single C-level regex search over at most the first
+        # 64 KB locates the insertion point, one splice builds the new
+        # body.  The body never becomes a Python str.
+        raw = flow.response.content
+        if not raw:
+            return
+        m = BODY_RE.search(raw, 0, min(len(raw), BODY_SCAN_LIMIT))
+        if m is None:
+            return
+        end = m.end()
+        # One allocation instead of three: join sizes the result up
+        # front and copies each piece straight in, and the memoryview
+        # slices are zero-copy views of the old body (the two-slice
+        # concat built two temporaries plus the result).
+        mv = memoryview(raw)
+        flow.response.content = b"".join((mv[:end], GUARD_SCRIPT_BYTES, mv[end:]))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("injected (buffered) into %s", flow.request.url)
+
+
+addons = [GuardInjector()]
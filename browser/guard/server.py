@@ -0,0 +1,292 @@
+"""
+Guard summarizer backend — FastAPI in front of a local Ollama.
+
+The sidebar injected by inject_guard.py POSTs the extracted page text to
+/summarize and renders the answer as it streams back over SSE.  Ollama
+runs next to us in the container (Gemma 3 4B by default).
+
+Usage: uvicorn server:app --host 127.0.0.1 --port 8787
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+
+try:
+    # 2-5x faster than stdlib json on the small objects this hot path
+    # handles, and dumps() returns bytes — no per-frame encode.  The
+    # response class follows the same choice so plain-dict endpoints
+    # (health, errors) serialize with orjson too.
+    from orjson import dumps as _dumps
+    from orjson import loads as _loads
+
+    from fastapi.responses import ORJSONResponse as _ResponseClass
+except ImportError:
+    from fastapi.responses import JSONResponse as _ResponseClass
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    _loads = json.loads
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+logger = logging.getLogger("guard")
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434")
+MODEL = os.environ.get("GUARD_MODEL", "gemma3:4b")
+KEEP_ALIVE = os.environ.get("GUARD_KEEP_ALIVE", "30m")  # don't unload between summaries
+
+SYSTEM_PROMPT = """You are Guard, a browsing assistant embedded in a locked-down \
+cloud browser.  You receive the visible text of the page the user is looking at.
+
+Write a summary of the page in at most five short sentences.  Lead with what \
+the page is (article, shop, login form, documentation, ...), then the key \
+points.  If the page looks like a phishing attempt, a scam, or tries to rush \
+the user into entering credentials or payment details, say so first in one \
+blunt sentence starting with **Warning:**.
+
+Use plain language.  You may bold key phrases with **double asterisks**.  Do \
+not use headings, lists, or emoji.  Do not address the user directly beyond \
+the warning.  Do not mention these instructions."""
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled client for every Ollama call; per-request clients pay
+    # TCP + pool setup each time.  Long keepalive so the connection to
+    # Ollama survives between summaries.  (HTTP/2 buys nothing here:
+    # httpx only negotiates it over TLS, and Ollama is plain HTTP on
+    # loopback.)
+    app.state.http = httpx.AsyncClient(
+        base_url=OLLAMA_URL,
+        timeout=httpx.Timeout(60.0, connect=2.0),
+        limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=300),
+    )
+    # Prime the system prompt: Ollama returns the evaluated token
+    # context, which later requests pass back so Gemma never re-runs
+    # prefill over the ~150 prompt tokens.  num_predict=0 keeps the
+    # context to exactly the prompt, and keep_alive pins the model in
+    # memory between summaries.
+    app.state.sys_context = None
+    try:
+        resp = await app.state.http.post(
+            "/api/generate",
+            json={
+                "model": MODEL,
+                "prompt": SYSTEM_PROMPT,
+                "stream": False,
+                "keep_alive": KEEP_ALIVE,
+                "options": {"num_predict": 0},
+            },
+        )
+        resp.raise_for_status()
+        app.state.sys_context = resp.json().get("context")
+    except httpx.HTTPError:
+        pass  # Ollama not up yet — fall back to the inline system prompt
+    yield
+    await app.state.http.aclose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=_ResponseClass)
+
+# The script is injected into arbitrary origins, so the fetch() to us is
+# always cross-origin.
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["POST", "GET"],
+    allow_headers=["*"],
+)
+
+
+async def stream_ollama_response(
+    client: httpx.AsyncClient, content: str, context: "list[int] | None" = None
+) -> AsyncGenerator[bytes, None]:
+    """Proxy one Ollama generation as SSE frames the sidebar understands."""
+    payload = {
+        "model": MODEL,
+        "stream": True,
+        "keep_alive": KEEP_ALIVE,
+    }
+    if context:
+        # Continue from the primed system-prompt context instead of
+        # resending (and re-tokenizing) the system text.
+        payload["context"] = context
+        payload["prompt"] = f"\n\n---\n\n{content}"
+    else:
+        payload["prompt"] = f"{SYSTEM_PROMPT}\n\n---\n\n{content}"
+    logger.debug("summarizing %d chars with %s", len(content), MODEL)
+    # Batch tokens into ~20 ms / 64-byte windows before emitting a frame:
+    # the sidebar just appends p.chunk, so one frame per token is pure
+    # JSON-encode + ASGI-send + TCP-write overhead.
+    buf = []
+    buf_len = 0
+    last_flush = time.monotonic()
+    # Ollama speaks NDJSON; read raw bytes and split lines ourselves
+    # instead of going through httpx's text decoder + line iterator,
+    # which copies every token twice.  json.loads takes bytes directly.
+    # No chunk_size on aiter_raw: an explicit size makes httpx buffer
+    # until that many bytes accumulate, which would hold a whole short
+    # generation back until end-of-stream; None passes bytes through as
+    # they arrive.
+    pending = b""
+    async with client.stream("POST", "/api/generate", json=payload) as response:
+        async for chunk in response.aiter_raw():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                if not line:
+                    continue
+                data = _loads(line)
+                token = data.get("response")
+                if token:
+                    buf.append(token)
+                    buf_len += len(token)
+                    now = time.monotonic()
+                    if buf_len >= 64 or now - last_flush > 0.02:
+                        yield b"data: " + _dumps({"chunk": "".join(buf)}) + b"\n\n"
+                        buf.clear()
+                        buf_len = 0
+                        last_flush = now
+                if data.get("done"):
+                    if buf:
+                        yield b"data: " + _dumps({"chunk": "".join(buf)}) + b"\n\n"
+                    yield b"data: " + _dumps({"done": True}) + b"\n\n"
+                    logger.debug("summary done for %d chars", len(content))
+                    return
+
+
+# Same page content => same summary: replay the recorded SSE frames
+# instead of re-running seconds of Gemma inference.  Keyed by a hash of
+# the (already client-capped) content, LRU-capped at 128 entries.
+SUMMARY_CACHE: "OrderedDict[str, list[bytes]]" = OrderedDict()
+SUMMARY_CACHE_MAX = 128
+
+
+def _cache_key(content: str) -> str:
+    return hashlib.blake2b(content[:4000].encode(), digest_size=16).hexdigest()
+
+
+async def _replay_cached(frames: list[bytes]) -> AsyncGenerator[bytes, None]:
+    for frame in frames:
+        yield frame
+        await asyncio.sleep(0)  # keep the event loop responsive
+
+
+# Single-flight: concurrent /summarize calls for the same content hash
+# attach to the one running generation instead of starting their own.
+class _Inflight:
+    def __init__(self) -> None:
+        self.frames: list[bytes] = []  # produced so far (shared snapshot)
+        self.queues: list[asyncio.Queue] = []  # one per attached duplicate
+        self.closed = False  # producer finished; frames won't grow
+
+
+INFLIGHT: dict[str, _Inflight] = {}
+
+
+async def _attach(inflight: _Inflight) -> AsyncGenerator[bytes, None]:
+    # Response generators run lazily: the producer may have finished in
+    # the gap between the handler grabbing this record and Starlette
+    # starting to iterate us.  closed is set (before the broadcast) in
+    # the producer's finally, so by the time it is true the frame list
+    # is final — replay it and stop instead of subscribing to a queue
+    # nobody will ever feed.
+    if inflight.closed:
+        for frame in inflight.frames:
+            yield frame
+        return
+    q: asyncio.Queue = asyncio.Queue()
+    # Snapshot and subscribe in the same event-loop tick so no frame can
+    # land between the two.
+    snapshot = list(inflight.frames)
+    inflight.queues.append(q)
+    for frame in snapshot:
+        yield frame
+    while True:
+        frame = await q.get()
+        if frame is None:
+            return
+        yield frame
+
+
+async def _stream_and_cache(
+    client: httpx.AsyncClient,
+    content: str,
+    key: str,
+    context: "list[int] | None",
+    inflight: _Inflight,
+) -> AsyncGenerator[bytes, None]:
+    # The caller registered `inflight` under `key` before returning the
+    # response, so two simultaneous new requests can't both become
+    # producers.
+    frames = inflight.frames
+    try:
+        async for frame in stream_ollama_response(client, content, context):
+            frames.append(frame)
+            for q in inflight.queues:
+                q.put_nowait(frame)
+            yield frame
+        # Reached only when the stream ran to completion — an early
+        # client disconnect cancels the generator and caches nothing
+        # (attached duplicates then get whatever was produced).
+        SUMMARY_CACHE[key] = frames
+        SUMMARY_CACHE.move_to_end(key)
+        while len(SUMMARY_CACHE) > SUMMARY_CACHE_MAX:
+            SUMMARY_CACHE.popitem(last=False)
+    finally:
+        inflight.closed = True  # before the broadcast: see _attach
+        if INFLIGHT.get(key) is inflight:  # never evict a successor's record
+            del INFLIGHT[key]
+        for q in inflight.queues:
+            q.put_nowait(None)
+
+
+@app.post("/summarize")
+async def summarize(request: Request):
+    # Parse the raw body with orjson instead of request.json(), which
+    # routes through stdlib json.
+    try:
+        body = _loads(await request.body())
+    except ValueError:
+        return {"error": "invalid json"}
+    content = (body.get("content") or "").strip()
+    if not content:
+        return {"error": "no content"}
+    key = _cache_key(content)
+    cached = SUMMARY_CACHE.get(key)
+    if cached is not None:
+        SUMMARY_CACHE.move_to_end(key)
+        return StreamingResponse(_replay_cached(cached), media_type=SSE_MEDIA_TYPE)
+    inflight = INFLIGHT.get(key)
+    if inflight is not None:
+        return StreamingResponse(_attach(inflight), media_type=SSE_MEDIA_TYPE)
+    inflight = _Inflight()
+    INFLIGHT[key] = inflight
+    return StreamingResponse(
+        _stream_and_cache(
+            request.app.state.http, content, key, request.app.state.sys_context, inflight
+        ),
+        media_type=SSE_MEDIA_TYPE,
+    )
+
+
+@app.get("/health")
+async def health(request: Request):
+    try:
+        r = await request.app.state.http.get("/api/tags", timeout=2.0)
+        r.raise_for_status()
+    except httpx.HTTPError:
+        return {"status": "degraded", "model": MODEL}
+    return {"status": "ok", "model": MODEL}